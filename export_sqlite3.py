@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Export history logged by log_sqlite3.py to columnar chunks for offline analysis.
+
+The narrow sage2_reading table (one row per register per sample) is streamed in
+bounded-memory chunks; each chunk is pivoted into one column per register,
+aligned on timestamps, and written as compressed NumPy .npz or gzipped CSV.
+
+Run with --help to see the available options.
+"""
+
+import argparse
+import csv
+import gzip
+import sqlite3
+
+import numpy as np
+
+
+parser = argparse.ArgumentParser(
+    description="Export logged Burnham Alpine (Sage 2) history to NPZ/CSV chunks."
+)
+parser.add_argument("--db", default="sage_boiler.sqlite3", help="SQLite3 database.")
+parser.add_argument("--boiler", default=1, type=int, help="Boiler (Modbus slave) id.")
+parser.add_argument(
+    "--output",
+    default="sage_boiler",
+    help="Output path prefix; chunks are written as [output]-NNNN.npz/.csv.gz",
+)
+parser.add_argument("--format", default="npz", choices=["npz", "csv"])
+parser.add_argument("--start", help="Earliest timestamp (UTC), e.g. '2023-10-01'.")
+parser.add_argument("--end", help="Latest timestamp (UTC), exclusive.")
+parser.add_argument(
+    "--registers",
+    type=lambda s: [int(r) for r in s.split(",")],
+    help="Comma-separated registers to export (default: all).",
+)
+parser.add_argument(
+    "--chunk_size",
+    default=10000,
+    type=int,
+    help="Maximum timestamps (rows) per chunk; memory is about "
+    "chunk_size * registers * 8 bytes.",
+)
+
+
+def _query(args, columns):
+    where, params = ["boiler = ?"], [args.boiler]
+    if args.start:
+        where.append("timestamp >= ?")
+        params.append(args.start)
+    if args.end:
+        where.append("timestamp < ?")
+        params.append(args.end)
+    if args.registers:
+        where.append("register IN (%s)" % ",".join("?" * len(args.registers)))
+        params += args.registers
+    return "SELECT %s FROM sage2_reading WHERE %s" % (columns, " AND ".join(where)), params
+
+
+def registers(db_con, args) -> dict:
+    "Returns register to title for all registers being exported, in order"
+    query, params = _query(args, "register, MAX(title)")
+    return dict(db_con.execute(query + " GROUP BY register ORDER BY register", params))
+
+
+def rows(db_con, args, batch=10000):
+    """Yields (timestamp, register, value) rows oldest first
+
+    The (boiler, timestamp) index created by log_sqlite3.py (see
+    sage_counters.create_tables) supplies this order, with or without a time
+    range, so rows stream without sorting the whole result first.
+    """
+    query, params = _query(args, "timestamp, register, value")
+    cursor = db_con.execute(query + " ORDER BY timestamp", params)
+    while True:
+        fetched = cursor.fetchmany(batch)
+        if not fetched:
+            return
+        yield from fetched
+
+
+def chunks(rows, columns, chunk_size):
+    """Yields (timestamps, values) per chunk of at most chunk_size timestamps,
+    never splitting a timestamp across chunks
+
+    timestamps are seconds since the epoch (UTC); values has one column per
+    register in columns, NaN where a register was not logged. Rows must be
+    in time order, as returned by rows().
+
+    Both arrays are preallocated once and reused for every chunk, so copy
+    them to keep them beyond the next chunk.
+    """
+    column = dict((register, i) for i, register in enumerate(columns))
+    timestamps = np.empty(chunk_size, dtype=np.int64)
+    values = np.full((chunk_size, len(columns)), np.nan)
+
+    row, previous = -1, None
+    for timestamp, register, value in rows:
+        if timestamp != previous:
+            row += 1
+            if row == chunk_size:
+                yield timestamps, values
+                values.fill(np.nan)
+                row = 0
+            timestamps[row] = np.datetime64(timestamp, "s").astype(np.int64)
+            previous = timestamp
+        if value is not None:
+            values[row, column[register]] = value
+    if row >= 0:
+        yield timestamps[:row + 1], values[:row + 1]
+
+
+def write_npz(path, titles, timestamps, values):
+    np.savez_compressed(
+        path,
+        timestamp=timestamps,
+        registers=np.array(list(titles)),
+        titles=np.array(list(titles.values())),
+        **{"r%d" % register: values[:, i] for i, register in enumerate(titles)},
+    )
+
+
+def write_csv(path, titles, timestamps, values):
+    with gzip.open(path, "wt", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["timestamp"] + ["%s (%d)" % (title, r) for r, title in titles.items()]
+        )
+        for timestamp, row in zip(timestamps, values):
+            writer.writerow([timestamp] + [_format(v) for v in row])
+
+
+def _format(value):
+    "Formats a value without losing precision, e.g. of 32-bit counters"
+    if np.isnan(value):
+        return ""
+    if value.is_integer():
+        return "%d" % value
+    return repr(float(value))
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    db_con = sqlite3.connect(args.db)
+    titles = registers(db_con, args)
+    if not titles:
+        parser.exit(message="No readings match\n")
+
+    write, extension = {
+        "npz": (write_npz, "npz"),
+        "csv": (write_csv, "csv.gz"),
+    }[args.format]
+
+    for i, (timestamps, values) in enumerate(
+        chunks(rows(db_con, args), titles, args.chunk_size)
+    ):
+        path = "%s-%04d.%s" % (args.output, i, extension)
+        write(path, titles, timestamps, values)
+        print("%s: %d rows" % (path, len(timestamps)))
+    db_con.close()
@@ -6,6 +6,8 @@ import sys
 import os.path
 
 import sage_boiler
+import sage_anomaly
+import sage_counters
 
 boiler = None
 if os.path.exists(sys.argv[1]):
@@ -46,6 +48,12 @@ db_cur.execute('''
 	);
 ''')
 
+# Record cycles and runtime missed since the previous sample (e.g. while the
+# logger was down), according to the controller's own counters
+sage_counters.create_tables(db_cur)
+sage_counters.reconcile(db_cur, boiler.boiler, dict(
+	(reading['register'], reading['raw_value']) for reading in readings))
+
 db_cur.executemany('''
 	INSERT INTO sage2_reading VALUES (
 		CURRENT_TIMESTAMP,
@@ -60,4 +68,13 @@ db_cur.executemany('''
 db_con.commit()
 db_con.close()
 
+# Watch for slow drift in flame signal, delta-T and stack temperature; the
+# detector state is carried between runs
+monitor = sage_anomaly.Sage2AnomalyMonitor()
+monitor.load('sage_anomaly.json')
+for event in monitor.sample(boiler):
+	print('%s drifted %+.0f%% from baseline %.1f to %.1f' % (
+		event.metric, event.change * 100, event.baseline, event.recent))
+monitor.save('sage_anomaly.json')
+
 print(boiler.tabulate())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""Streaming detection of slow drift in boiler health metrics
+
+* Flame signal sliding down over weeks suggests a fouled or failing flame rod
+* Shrinking supply/return delta-T suggests heat-exchanger scaling
+* Rising stack-minus-return spread suggests heat-exchanger scaling
+
+Each metric is only sampled while the burner is running, and is tracked
+separately per firing rate band so that normal modulation is not mistaken for
+drift. Per band, a slow time-based EWMA forms the baseline and a fast EWMA the
+recent level; an event is raised when the recent level drifts past a threshold
+relative to the baseline. State is a fixed handful of floats per boiler and can
+be persisted as JSON between (e.g. cron) runs.
+
+Run as a script to replay archived history from log_sqlite3.py and set
+baselines:
+
+    $ python sage_anomaly.py sage_boiler.sqlite3 sage_anomaly.json
+"""
+
+import calendar
+import json
+import math
+import sqlite3
+import time
+from collections import namedtuple
+
+Sage2DriftEvent = namedtuple(
+    'Sage2DriftEvent', 'timestamp metric band baseline recent change')
+
+# Registers sampled by the detectors (see Sage2Boiler)
+SUPPLY, FIRING_RATE, FLAME_SIGNAL, RETURN, STACK, BURNER_STATE = 7, 8, 10, 11, 14, 33
+REGISTERS = (SUPPLY, FIRING_RATE, FLAME_SIGNAL, RETURN, STACK, BURNER_STATE)
+
+BURNER_RUN = 12 # see Sage2BurnerStateReading
+
+
+class Sage2DriftDetector(object):
+    """EWMA baseline and recent level of one metric, per firing rate band
+
+    threshold is the relative change from baseline (e.g. -0.2 for a 20% drop)
+    that raises an event; the event re-arms once the change recovers to half
+    the threshold.
+    """
+    band_width = 10             # firing rate percent per band
+    baseline_tau = 30 * 86400   # seconds; baseline follows only slow change
+    recent_tau = 86400          # seconds
+    warmup = 3 * 86400          # seconds of samples before raising events
+
+    def __init__(self, name, threshold):
+        self.name = name
+        self.threshold = threshold
+        self.bands = {}
+
+    def value(self, values):
+        raise NotImplementedError
+
+    def band(self, values):
+        return int(min(max(values[FIRING_RATE], 0), 100) // self.band_width)
+
+    def update(self, timestamp, values):
+        "Returns a Sage2DriftEvent when drift crosses threshold, otherwise None"
+        if values.get(BURNER_STATE) != BURNER_RUN:
+            return None
+        try:
+            value = self.value(values)
+            band = self.band(values)
+        except (KeyError, TypeError, ZeroDivisionError):
+            return None
+
+        state = self.bands.get(band)
+        if state is None:
+            self.bands[band] = {
+                'baseline': value, 'recent': value,
+                'first': timestamp, 'last': timestamp, 'armed': True}
+            return None
+
+        if timestamp <= state['last']:
+            # Already seen, e.g. replaying history over saved state
+            return None
+        dt = timestamp - state['last']
+        state['last'] = timestamp
+        for key, tau in (('baseline', self.baseline_tau), ('recent', self.recent_tau)):
+            alpha = 1 - math.exp(-dt / float(tau))
+            state[key] += alpha * (value - state[key])
+
+        if timestamp - state['first'] < self.warmup or not state['baseline']:
+            return None
+
+        change = (state['recent'] - state['baseline']) / abs(state['baseline'])
+        exceeded = change / self.threshold
+        if state['armed'] and exceeded >= 1:
+            state['armed'] = False
+            return Sage2DriftEvent(
+                timestamp, self.name, band,
+                state['baseline'], state['recent'], change)
+        if not state['armed'] and exceeded < 0.5:
+            state['armed'] = True
+        return None
+
+
+class Sage2FlameSignalDetector(Sage2DriftDetector):
+    def value(self, values):
+        return values[FLAME_SIGNAL]
+
+
+class Sage2DeltaTDetector(Sage2DriftDetector):
+    def value(self, values):
+        return values[SUPPLY] - values[RETURN]
+
+
+class Sage2StackSpreadDetector(Sage2DriftDetector):
+    def value(self, values):
+        return values[STACK] - values[RETURN]
+
+
+class Sage2AnomalyMonitor(object):
+    "Drift detectors for one boiler, with JSON-serializable state"
+
+    def __init__(self):
+        self.detectors = [
+            Sage2FlameSignalDetector('Flame Signal', -0.2),
+            Sage2DeltaTDetector('Delta-T (Supply - Return)', -0.25),
+            Sage2StackSpreadDetector('Stack - Return Spread', 0.5),
+        ]
+
+    def update(self, timestamp, values):
+        """Feed one sample of decoded values keyed by register, returning a
+        list of any Sage2DriftEvents raised"""
+        events = (detector.update(timestamp, values) for detector in self.detectors)
+        return [event for event in events if event]
+
+    def sample(self, boiler, timestamp=None):
+        "Feed the current readings of a Sage2Boiler"
+        values = {
+            SUPPLY: boiler.supply_sensor.value,
+            FIRING_RATE: boiler.firing_rate_requested.value,
+            FLAME_SIGNAL: boiler.flame_signal.value,
+            RETURN: boiler.return_sensor.value,
+            STACK: boiler.stack_sensor.value,
+            BURNER_STATE: boiler.burner_state.raw_value,
+        }
+        return self.update(timestamp or time.time(), values)
+
+    def replay(self, db_path, boiler=1):
+        """Feed archived history from the log_sqlite3.py database, oldest
+        first, returning a list of any Sage2DriftEvents raised
+
+        Samples no newer than the saved state are skipped, so replaying over
+        state kept by log_sqlite3.py doesn't count history twice.
+        """
+        db_con = sqlite3.connect(db_path)
+        rows = db_con.execute('''
+            SELECT timestamp, register, value FROM sage2_reading
+            WHERE boiler = ? AND register IN (%s)
+            ORDER BY timestamp
+        ''' % ','.join('?' * len(REGISTERS)), (boiler,) + REGISTERS)
+
+        events = []
+        timestamp, values = None, {}
+        for row_timestamp, register, value in rows:
+            if row_timestamp != timestamp:
+                if values:
+                    events += self.update(_parse_timestamp(timestamp), values)
+                timestamp, values = row_timestamp, {}
+            values[register] = value
+        if values:
+            events += self.update(_parse_timestamp(timestamp), values)
+        db_con.close()
+        return events
+
+    def load(self, path):
+        "Restore detector state saved by save(), if any"
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        for detector in self.detectors:
+            bands = state.get(detector.name, {})
+            detector.bands = dict((int(band), s) for band, s in bands.items())
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(dict(
+                (detector.name, detector.bands) for detector in self.detectors
+            ), f, indent=2, sort_keys=True)
+
+
+def _parse_timestamp(timestamp):
+    "SQLite CURRENT_TIMESTAMP (UTC) to seconds since the epoch"
+    return calendar.timegm(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S'))
+
+
+if __name__ == '__main__':
+    import sys
+
+    monitor = Sage2AnomalyMonitor()
+    state_path = len(sys.argv) > 2 and sys.argv[2] or None
+    if state_path:
+        monitor.load(state_path)
+
+    for event in monitor.replay(sys.argv[1]):
+        print('{0}: {1.metric} drifted {2:+.0%} at {3}% firing rate '
+              '(baseline {1.baseline:.1f}, recent {1.recent:.1f})'.format(
+                  time.strftime('%Y-%m-%d %H:%M', time.gmtime(event.timestamp)),
+                  event, event.change, event.band * Sage2DriftDetector.band_width))
+
+    if state_path:
+        monitor.save(state_path)
@@ -1,13 +1,22 @@
 import struct
 import operator
+import json
+import logging
+import math
+import os.path
+import time
+from collections import deque
 from unicodedata import normalize
-from functools import partial
 
 # Uniform Modbus TCP and RTU interface library
 from modbus_tk.modbus_rtu import RtuMaster
 from modbus_tk.modbus_tcp import TcpMaster
+from modbus_tk import utils as modbus_utils
 import modbus_tk.defines as cst
 
+# Vectorized decoding and windowed statistics over register history
+import numpy as np
+
 # Used to pretty-print data tables (e.g. stdout)
 from tabulate import tabulate
 
@@ -25,6 +34,25 @@ from cachetools import cachedmethod, TTLCache
 # * Simpler, minimalmodbus-based: https://github.com/alanmitchell/mini-monitor/blob/master/readers/sage_boiler.py
 # * Sage2 Controller Modbus Interface Documentation (circa 2012): https://www.ccontrols.com/support/dp/Sage2.doc
 
+LOGGER = logging.getLogger(__name__)
+
+# Temperature registers are tenths of a degree Celsius; maps units to
+# (multiplier, offset, label)
+TEMPERATURE_UNITS = {
+    'F': (0.18, 32, u'\N{DEGREE SIGN}F'),
+    'C': (0.1, 0, u'\N{DEGREE SIGN}C'),
+}
+
+def _largest_match_table(possible_values):
+    """Returns a dense array mapping each raw value, up to the largest key, to
+    the largest key not above it (or the smallest key, below all keys)"""
+    keys = sorted(possible_values)
+    table = np.empty(keys[-1] + 1, dtype=np.int64)
+    table[:keys[0]] = keys[0]
+    for key, next_key in zip(keys, keys[1:] + [keys[-1] + 1]):
+        table[key:next_key] = key
+    return table
+
 class Sage2Reading(object):
     multiplier, offset = 1, 0
     default_format = '{self.title}: {self.value:d}'
@@ -50,13 +78,43 @@ class Sage2Reading(object):
 
     @property
     def value(self):
-        value = self.raw_value * self.multiplier + self.offset
+        return self.value_of(self.raw_value * self.multiplier + self.offset)
+
+    def value_of(self, decoded):
+        "Returns value as reported by .value, given a value from decode()"
+        value = decoded.item() if isinstance(decoded, np.generic) else decoded
         return int(value) == value and int(value) or round(value, 1)
 
     @property
     def raw_value(self):
         return self.boiler.read(self.register, 1)
 
+    def decode_raw(self, registers):
+        """Returns raw values from an array of register snapshots (one per row)
+
+        register may also be an array of registers, decoding a column per
+        register in one go.
+        """
+        return registers[:, self.register].astype(np.int64)
+
+    def decode(self, registers, temperature_units=None):
+        """Returns values from an array of register snapshots (one per row)
+
+        temperature_units ('F' or 'C') overrides the boiler's units for
+        temperature readings.
+        """
+        return self.decode_raw(registers) * self.multiplier + self.offset
+
+    def window(self, seconds, now=None):
+        "Returns recorded history of this reading over the last seconds"
+        history = self.boiler.history
+        if history is None:
+            raise RuntimeError(
+                'History is not enabled; pass history=Sage2History() to Sage2Boiler')
+        timestamps, registers = history.window(seconds, now)
+        return Sage2Window(self, timestamps, self.decode(registers), now,
+                           max_hold=history.max_hold(timestamps))
+
 class Sage2FiringRateReading(Sage2Reading):
     units = '%'
 
@@ -79,11 +137,36 @@ class Sage2FiringRateReading(Sage2Reading):
             value = 0
         return int(value)
 
+    def decode(self, registers, temperature_units=None):
+        raw_value = self.decode_raw(registers)
+        value = (raw_value & (2**15 - 1)).astype(np.float64)
+        # Shaped to broadcast against one or many columns of raw values
+        shape = (len(registers),) + (1,) * (raw_value.ndim - 1)
+        modulation_source = registers[:, 192].astype(np.int64).reshape(shape)
+        max_rpm = registers[:, 193].astype(np.float64).reshape(shape)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = np.where(modulation_source == 0,
+                             100.0 * value / max_rpm, value)
+        value = np.where(modulation_source == 1, value / 10.0, value)
+        value = np.where(raw_value >> 15 == modulation_source, value, 0)
+        return np.trunc(np.nan_to_num(value))
+
+    def value_of(self, decoded):
+        return int(decoded)
+
 class Sage2TemperatureReading(Sage2Reading):
-    multiplier, offset = 0.18, 32 # Fahrenheit
-    #multiplier, offset = 0.1, 0 # Celsius
     default_format = u'{self.title}: {self.value:.1f}'
-    units = u'\N{DEGREE SIGN}F'
+
+    def __init__(self, boiler, register, title, units=None, summary=False,
+                 temperature_units=None):
+        """temperature_units is 'F' or 'C', defaulting to the boiler's
+        temperature units"""
+        multiplier, offset, label = \
+            TEMPERATURE_UNITS[temperature_units or boiler.temperature_units]
+        super(Sage2TemperatureReading, self).__init__(
+            boiler, register, title, units or label, summary)
+        self.multiplier, self.offset = multiplier, offset
 
     @property
     def raw_value(self):
@@ -95,38 +178,62 @@ class Sage2TemperatureReading(Sage2Reading):
         # http://github.com/alanmitchell/mini-monitor/blob/master/readers/sage_boiler.py
         return temperature if temperature < 2**15 else temperature - 2**16
 
+    def decode_raw(self, registers):
+        temperature = super(Sage2TemperatureReading, self).decode_raw(registers)
+        return np.where(temperature < 2**15, temperature, temperature - 2**16)
+
+    def decode(self, registers, temperature_units=None):
+        multiplier, offset = self.multiplier, self.offset
+        if temperature_units:
+            multiplier, offset, _ = TEMPERATURE_UNITS[temperature_units]
+        return self.decode_raw(registers) * multiplier + offset
+
 class Sage2FlameSignalReading(Sage2Reading):
     multiplier = 0.01
     units = u'\N{MICRO SIGN}A'
 
 class Sage2ModulationReading(Sage2Reading):
     @property
-    def raw_value(self):
-        modulation = super(Sage2ModulationReading, self).raw_value
-        if modulation < 2**15:
-            self.units = 'rpm'
-        else:
-            self.units = '%'
-            self.offset = -2**15
-        return modulation
+    def units(self):
+        return 'rpm' if self.raw_value < 2**15 else '%'
+
+    @property
+    def value(self):
+        modulation = self.raw_value
+        return modulation if modulation < 2**15 else modulation - 2**15
+
+    def decode(self, registers, temperature_units=None):
+        modulation = self.decode_raw(registers)
+        return np.where(modulation < 2**15, modulation, modulation - 2**15)
 
 class Sage2EnumeratedReading(Sage2Reading):
     default_format = '{self.title}: {self.value}'
     possible_values = {}
+    largest_match = None # built once per subclass, see _largest_match_table
+
+    def __init_subclass__(cls, **kwargs):
+        super(Sage2EnumeratedReading, cls).__init_subclass__(**kwargs)
+        cls.largest_match = _largest_match_table(cls.possible_values)
 
     @property
     def raw_value(self):
-        from functools import reduce
         "Returns largest matching key within enumeration of possible values"
         raw_value = super(Sage2EnumeratedReading, self).raw_value
-        largest_match = lambda x, y: y <= raw_value and y or x
-        return reduce(largest_match, sorted(self.possible_values))
+        return int(self.largest_match[min(raw_value, len(self.largest_match) - 1)])
 
     @property
     def value(self):
         "Returns largest matching value from enumeration of possible values"
         return self.possible_values.get(self.raw_value, None)
 
+    def value_of(self, decoded):
+        return self.possible_values.get(int(decoded), None)
+
+    def decode(self, registers, temperature_units=None):
+        "Returns largest matching keys within enumeration of possible values"
+        raw_value = self.decode_raw(registers)
+        return self.largest_match[np.minimum(raw_value, len(self.largest_match) - 1)]
+
 class Sage2BurnerStateReading(Sage2EnumeratedReading):
     possible_values = {
         0:   'Initiate',
@@ -237,39 +344,365 @@ class Sage2CounterReading(Sage2Reading):
         #return reg[0] * 2**8 + reg[1] # unsigned 32-bit result
         return reg
 
+    def decode_raw(self, registers):
+        high = registers[:, self.register].astype(np.int64)
+        low = registers[:, self.register + 1].astype(np.int64)
+        return high << 16 | low
+
+
+class Sage2Window(object):
+    """Recorded history of one reading over a window of time
+
+    Statistics are computed over decoded values without touching the bus.
+    """
+    def __init__(self, reading, timestamps, values, now=None, max_hold=None):
+        self.reading = reading
+        self.timestamps = timestamps
+        self.values = values
+        self.now = now
+        self.max_hold = max_hold
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def min(self):
+        return self.values.min() if len(self) else None
+
+    @property
+    def max(self):
+        return self.values.max() if len(self) else None
+
+    @property
+    def mean(self):
+        return self.values.mean() if len(self) else None
+
+    @property
+    def last(self):
+        return self.values[-1] if len(self) else None
+
+    @property
+    def slope(self):
+        "Least-squares trend in units per minute"
+        if len(self) < 2 or np.ptp(self.timestamps) == 0:
+            return None
+        return np.polyfit(self.timestamps, self.values, 1)[0] * 60
+
+    def time_in_state(self):
+        """Returns seconds spent in each state, i.e. each value held until the
+        next sample (or now, for the last sample)
+
+        Each value is held for at most max_hold seconds, so that time when
+        nothing was recorded (e.g. polling stopped) isn't credited to the
+        last state seen.
+        """
+        if not len(self):
+            return {}
+        now = self.now if self.now is not None else time.time()
+        durations = np.diff(np.append(self.timestamps, max(now, self.timestamps[-1])))
+        if self.max_hold is not None:
+            durations = np.minimum(durations, self.max_hold)
+        states, inverse = np.unique(self.values, return_inverse=True)
+        seconds = np.bincount(inverse, weights=durations)
+
+        possible_values = getattr(self.reading, 'possible_values', None)
+        return dict(
+            (possible_values.get(state) if possible_values else state.item(),
+             float(total))
+            for state, total in zip(states, seconds))
+
+
+class Sage2History(object):
+    """Fixed-memory ring buffer of recent register snapshots
+
+    Registers read by Sage2Boiler.dump() are stored at most once per interval
+    (dumps arriving sooner are skipped), each as an unsigned 16-bit integer
+    alongside a float64 timestamp, i.e. 464 bytes per snapshot. At the default
+    interval of one snapshot every 10 seconds, that is 167 KB per hour of
+    history.
+    """
+    registers = 228 # see Sage2Boiler.blocks
+
+    def __init__(self, hours=24, interval=10):
+        self.interval = interval
+        self.capacity = int(hours * 3600 / interval)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.snapshots = np.zeros((self.capacity, self.registers), dtype=np.uint16)
+        self.index = 0
+        self.count = 0
+
+    def max_hold(self, timestamps):
+        """Longest a recorded value is assumed to hold: twice the typical
+        spacing of the given snapshots, allowing for late polls"""
+        if len(timestamps) < 2:
+            return 2 * self.interval
+        return 2 * max(np.median(np.diff(timestamps)), self.interval)
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.snapshots.nbytes
+
+    def append(self, timestamp, registers):
+        """Record a snapshot of registers, as returned by Sage2Boiler.dump(),
+        unless the previous snapshot was less than interval ago
+
+        Allows 10% early, so that jitter in a poll loop running at the
+        interval doesn't skip every other snapshot.
+        """
+        if self.count:
+            previous = self.timestamps[(self.index - 1) % self.capacity]
+            # A clock stepped backwards is recorded rather than skipped
+            if 0 <= timestamp - previous < 0.9 * self.interval:
+                return
+        self.timestamps[self.index] = timestamp
+        self.snapshots[self.index] = [r or 0 for r in registers]
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def window(self, seconds, now=None):
+        """Returns (timestamps, snapshots) recorded within the last seconds,
+        oldest first"""
+        now = now if now is not None else time.time()
+        order = (self.index - self.count + np.arange(self.count)) % self.capacity
+        order = order[self.timestamps[order] >= now - seconds]
+        return self.timestamps[order], self.snapshots[order]
+
+
+class Sage2RtuTiming(object):
+    """Measured Modbus/RTU timing for one serial port
+
+    The response latency and jitter of each block size are measured against
+    the actual adapter (e.g. FTDI latency timer), cable and controller, and
+    response timeouts fitted to them, so that a lost or garbled response is
+    detected as soon as is safe. Timing is persisted per serial port, and the
+    error rate of subsequent reads is watched so that timing is re-tuned if it
+    rises.
+
+    N.B. modbus_tk stops reading as soon as a complete response arrives, so
+    a successful read takes as long as the controller does to respond,
+    whatever the timeout.
+    """
+    default_path = os.path.expanduser('~/.sage2_boiler_rtu.json')
+    samples = 8             # reads per block size when calibrating
+    safety_factor = 1.5     # multiplier applied to measured worst case
+    jitter_sigmas = 4       # standard deviations of jitter allowed for
+    min_timeout = 0.005     # floor for any response timeout (seconds)
+    default_timeout = 0.035 # uncalibrated timeout, 3.5 * t0 of 10ms
+    error_window = 50       # recent reads considered for error rate
+    max_error_rate = 0.05   # re-tune when errors exceed this fraction
+
+    def __init__(self, serial, path=None):
+        self.serial = serial
+        # Timing depends on baud rate as well as the adapter, so a port
+        # reopened at another baud rate is calibrated afresh
+        self.port = '%s@%d' % (serial.port, serial.baudrate)
+        self.path = path or self.default_path
+        self.t0 = modbus_utils.calculate_rtu_inter_char(serial.baudrate)
+        self.timeouts = {}
+        self.outcomes = deque(maxlen=self.error_window)
+        self.load()
+
+    @property
+    def calibrated(self):
+        return bool(self.timeouts)
+
+    def load(self):
+        "Load timing for this serial port and baud rate, if previously calibrated"
+        try:
+            with open(self.path) as f:
+                timing = json.load(f).get(self.port)
+        except (IOError, OSError, ValueError):
+            return
+        if timing:
+            self.t0 = timing['t0']
+            self.timeouts = dict(
+                (int(count), timeout)
+                for count, timeout in timing['timeouts'].items())
+
+    def save(self):
+        "Persist timing for this serial port and baud rate alongside any others"
+        try:
+            with open(self.path) as f:
+                ports = json.load(f)
+        except (IOError, OSError, ValueError):
+            ports = {}
+        ports[self.port] = {
+            't0': self.t0,
+            'timeouts': dict(
+                (str(count), timeout)
+                for count, timeout in self.timeouts.items()),
+            'calibrated': time.time(),
+        }
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(ports, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as e:
+            # Keep using the calibrated timing for this process regardless
+            LOGGER.warning('Unable to save RTU timing to %s: %s', self.path, e)
+
+    def transmit_time(self, count):
+        "Seconds on the wire for a response carrying count registers"
+        # 11 bits per character (start, 8 data, parity or stop, stop)
+        return (2 * count + 5) * 11.0 / self.serial.baudrate
+
+    def apply(self, master, count):
+        "Configure master for a read of count registers"
+        timeout = self.timeouts.get(count, self.default_timeout)
+        self.serial.inter_byte_timeout = 1.5 * self.t0
+        master.set_timeout(timeout)
+
+    def record(self, ok):
+        "Track read outcomes, dropping calibrated timing if errors rise"
+        self.outcomes.append(ok)
+        if not ok and self.calibrated and self.error_rate > self.max_error_rate:
+            # Fall back to default timeouts until re-calibrated
+            self.timeouts = {}
+
+    @property
+    def error_rate(self):
+        "Fraction of failed reads within the error window"
+        return self.outcomes.count(False) / float(self.error_window)
+
+    def measure(self, read, count):
+        """Returns (mean, jitter, worst) response latency in seconds for reads
+        of count registers, excluding time spent on the wire
+
+        modbus_tk keeps reading until the whole response arrives, so the
+        timeout only has to cover this latency, not the response itself.
+        """
+        latencies = []
+        for i in range(self.samples):
+            start = time.time()
+            read(count)
+            elapsed = time.time() - start
+            latencies.append(max(0.0, elapsed - self.transmit_time(count)))
+        mean = sum(latencies) / len(latencies)
+        jitter = math.sqrt(
+            sum((x - mean) ** 2 for x in latencies) / len(latencies))
+        return mean, jitter, max(latencies)
+
+    def calibrate(self, master, read, counts):
+        """Measure latency for each block size and choose the tightest safe
+        response timeouts
+
+        read is called with a register count and must perform one block read
+        of that size.
+        """
+        self.t0 = modbus_utils.calculate_rtu_inter_char(self.serial.baudrate)
+        self.timeouts = {}
+        self.serial.inter_byte_timeout = 1.5 * self.t0
+        for count in counts:
+            self.apply(master, count)
+            mean, jitter, worst = self.measure(read, count)
+            latency = max(worst, mean + self.jitter_sigmas * jitter)
+            self.timeouts[count] = max(
+                self.min_timeout, round(latency * self.safety_factor, 4))
+        self.outcomes.clear()
+        self.save()
+        return self.timeouts
+
 
 class Sage2Boiler(object):
-    def __init__(self, slave=1, host='localhost', port=502, serial=None):
+    # Hardcoded register extract for registers 0-177 and 192-227
+    #
+    # N.B. Up to 125 registers that can be retrieved in a single request
+    blocks = ((0, 100), (100, 77), (192, 36))
+
+    def __init__(self, slave=1, host='localhost', port=502, serial=None,
+                 timing_path=None, history=None, temperature_units='F'):
         self.cache = TTLCache(maxsize=128, ttl=10)
         self.__slave = slave
         self.boiler = slave
+        self.temperature_units = temperature_units
+        self.timing = None
+        self.history = history
 
         if serial:
-            self.__master = RtuMaster(serial, t0=0.01)
+            self.timing = Sage2RtuTiming(serial, timing_path)
+            self.__master = RtuMaster(serial, t0=self.timing.t0)
         else:
             self.__master = TcpMaster(host, port)
 	#self.__master.set_verbose(True)
 
-    def tabulate(self, summary=True):
+    def _reading_index(self):
+        """Returns [(property name, reading class, register, title, summary)]
+        for every Sage2Reading property, walked once per boiler class"""
         import inspect
 
-        def is_reading(prop):
-            """"Returns True when prop is a property and value of the property
-            is a Sage2Reading"""
-            return isinstance(prop, property) \
-                and isinstance(prop.__get__(self), Sage2Reading)
+        cls = self.__class__
+        if '_reading_index_cache' in cls.__dict__:
+            return cls._reading_index_cache
+
+        def is_property(member):
+            return isinstance(member, property)
+
+        index = []
+        for name, prop in inspect.getmembers(cls, is_property):
+            # Hack below invokes the property object so the descriptor
+            # calls its wrapped get method, (hopefully) returning a
+            # Sage2Reading object)
+            #
+            # https://docs.python.org/2/howto/descriptor.html
+            reading = prop.__get__(self)
+            if isinstance(reading, Sage2Reading):
+                index.append((name, reading.__class__, reading.register,
+                               reading.title, reading.summary))
+        cls._reading_index_cache = index
+        return index
+
+    def _decoders(self, summary=False):
+        """Returns [(reading class, [title], register array)], grouping
+        readings that decode alike, built once per boiler class"""
+        cls = self.__class__
+        cache = cls.__dict__.get('_decoders_cache')
+        if cache is None:
+            cache = cls._decoders_cache = {}
+        if summary not in cache:
+            groups = {}
+            for name, reading_class, register, title, is_summary in \
+                    self._reading_index():
+                if summary and not is_summary:
+                    continue
+                titles, registers = groups.setdefault(reading_class, ([], []))
+                titles.append(title)
+                registers.append(register)
+            cache[summary] = [
+                (reading_class, titles, np.array(registers))
+                for reading_class, (titles, registers) in groups.items()]
+        return cache[summary]
+
+    def readings(self, summary=False):
+        "Yields every Sage2Reading property of this boiler"
+        for name, reading_class, register, title, is_summary in \
+                self._reading_index():
+            if summary and not is_summary:
+                continue
+            yield getattr(self, name)
+
+    def decode(self, registers=None, summary=False, temperature_units=None):
+        """Returns a dict of reading title to value (as .value would report),
+        decoded in bulk from the given registers (as returned by dump()) or a
+        fresh dump()
+
+        Readings of each class are decoded together, e.g. every temperature
+        in one multiply-add. temperature_units ('F' or 'C') overrides this
+        boiler's units.
+        """
+        if registers is None:
+            registers = self.dump()
+        snapshot = np.array([[r or 0 for r in registers]], dtype=np.uint16)
+
+        values = {}
+        for reading_class, titles, columns in self._decoders(summary):
+            batch = reading_class(self, columns, None)
+            decoded = batch.decode(snapshot, temperature_units)[0]
+            for title, value in zip(titles, decoded):
+                values[title] = batch.value_of(value)
+        return values
 
+    def tabulate(self, summary=True):
         def readings():
-            for prop, reading in inspect.getmembers(self.__class__, is_reading):
-                # Hack below invokes the property object so the descriptor
-                # calls its wrapped get method, (hopefully) returning a
-                # Sage2Reading object)
-                #
-                # https://docs.python.org/2/howto/descriptor.html
-                reading = reading.__get__(self)
-
-                if summary and not reading.summary:
-                    continue
+            for reading in self.readings(summary):
                 yield (reading.title, reading.raw_value, reading.value, reading.units,)
                 #yield (reading.title, reading.value, reading.units,)
 
@@ -301,15 +734,70 @@ class Sage2Boiler(object):
         faster than accessing each register individually, depending on the
         number registers accessed.
 
-        Returns a tuple of 194 contiguous registers (0-193)
+        Returns a tuple of 228 contiguous registers (0-227), padded with None
+        where registers are not read
+
+        On a serial connection, each block read uses response timeouts
+        calibrated for its size (see Sage2RtuTiming). Each dump is recorded in
+        history, when provided (see Sage2History).
         """
+        registers = ()
+        for start, count in self.blocks:
+            registers += (None,) * (start - len(registers))
+            registers += self._read_block(start, count)
+
+        if self.timing and not self.timing.calibrated:
+            try:
+                self.calibrate()
+            except Exception as e:
+                # Registers were read regardless; try again next dump
+                LOGGER.warning('RTU timing calibration failed: %s', e)
+
+        if self.history is not None:
+            self.history.append(time.time(), registers)
+        return registers
+
+    def _read_block(self, start, count):
         function_code = cst.READ_HOLDING_REGISTERS # aka "3"
-        get = partial(self.__master.execute, *[self.__slave, function_code])
+        if not self.timing:
+            return self.__master.execute(
+                self.__slave, function_code, start, count)
+
+        self.timing.apply(self.__master, count)
+        try:
+            registers = self.__master.execute(
+                self.__slave, function_code, start, count)
+        except Exception:
+            if not self.timing.calibrated:
+                self.timing.record(False)
+                raise
+            # Calibrated timeouts are tight, so retry once with the default
+            # timeout before giving up
+            self.timing.record(False)
+            self.__master.set_timeout(self.timing.default_timeout)
+            registers = self.__master.execute(
+                self.__slave, function_code, start, count)
+
+        self.timing.record(True)
+        return registers
+
+    def calibrate(self):
+        """Measure serial response latency for each block read by dump() and
+        persist the tightest safe timeouts for this serial port
+
+        Called automatically at the end of dump() on an uncalibrated port, and
+        again whenever the read error rate rises.
+        Returns a dict of register count to response timeout in seconds.
+        """
+        assert self.timing, 'Timing calibration requires a serial connection'
+        function_code = cst.READ_HOLDING_REGISTERS
+        starts = dict((count, start) for start, count in self.blocks)
 
-        # Hardcoded register extract for registers 0-177 and 192-209
-        #
-        # N.B. Up to 125 registers that can be retrieved in a single request
-        return get(0, 100) + get(100, 77) + (None,) * 15 + get(192, 36)
+        def read(count):
+            return self.__master.execute(
+                self.__slave, function_code, starts[count], count)
+
+        return self.timing.calibrate(self.__master, read, sorted(starts))
 
     def identify_valid_registers(self, min, max):
         from operator import itemgetter
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""Reconcile cycle and runtime accounting against the controller's counters
+
+Cycles and runtime observed in logged samples (burner state and pump status
+transitions between consecutive samples) miss anything that happens while the
+logger or bus is down, and cycles too short to fall between two polls. The
+Sage2 controller's own 32-bit counters hold the ground truth, so on each poll
+the counter deltas since the previous logged sample are compared with what the
+samples show. Differences are carried as a running total per counter, and
+written to the sage2_gap table once they amount to a whole cycle or hour.
+
+Daily and monthly reports then add the missed cycles and hours to those
+observed in samples. Run as a script for a report:
+
+    $ python sage_counters.py sage_boiler.sqlite3 month
+"""
+
+import calendar
+import time
+from collections import defaultdict, namedtuple
+
+from sage_boiler import Sage2PumpStatusReading
+
+BURNER_STATE = 33
+BURNER_RUN = 12 # see Sage2BurnerStateReading
+
+
+def _burner_running(sample):
+    return sample.get(BURNER_STATE) == BURNER_RUN
+
+def _pump_on(register):
+    def pump_on(sample):
+        status = Sage2PumpStatusReading.possible_values.get(sample.get(register), '')
+        return status.startswith(('On', 'Forced On'))
+    return pump_on
+
+def _always(sample):
+    return True
+
+
+class Sage2Counter(namedtuple('Sage2Counter', 'register title units active')):
+    """A controller counter, with active(sample) returning True while the
+    counted activity (e.g. burner running) is observed in a sample"""
+
+    def observe(self, previous, current, elapsed):
+        "Returns cycles or hours observed between two consecutive samples"
+        if self.units == 'hours':
+            both = self.active(previous) and self.active(current)
+            return elapsed / 3600.0 if both else 0.0
+        if self.active is _always:
+            return 0 # e.g. controller power cycles can't be observed
+        return int(self.active(current) and not self.active(previous))
+
+    def settled(self, missed):
+        """Returns True once a running total of missed activity should be
+        written as a gap
+
+        Counters only tick on whole cycles or hours, and not necessarily in
+        the same poll as the activity shows in samples, so observed activity
+        may lead the counter by up to one tick.
+        """
+        return missed >= 1 or missed < -1
+
+
+# See counter_* properties of Sage2Boiler
+COUNTERS = (
+    Sage2Counter(128, 'Cycle Count (Burner)', 'cycles', _burner_running),
+    Sage2Counter(130, 'Burner Run Time', 'hours', _burner_running),
+    Sage2Counter(132, 'Cycle Count (CH Pump)', 'cycles', _pump_on(96)),
+    Sage2Counter(134, 'Cycle Count (DHW Pump)', 'cycles', _pump_on(100)),
+    Sage2Counter(138, 'Cycle Count (Boiler Pump)', 'cycles', _pump_on(108)),
+    Sage2Counter(142, 'Cycle Count (Controller)', 'cycles', _always),
+    Sage2Counter(144, 'Controller Run Time', 'hours', _always),
+)
+
+# Registers needed to observe activity in samples
+STATE_REGISTERS = (BURNER_STATE, 96, 100, 108)
+
+# Report periods: strftime format, and length of the matching prefix of a
+# SQLite timestamp
+PERIODS = {'day': ('%Y-%m-%d', 10), 'month': ('%Y-%m', 7)}
+
+
+def counter_delta(previous, current):
+    """Returns (delta, reason) between two readings of a 32-bit counter
+
+    A counter that goes backwards has either wrapped around, leaving a small
+    modular delta, or been reset (e.g. controller replaced), in which case it
+    has counted up from zero.
+    """
+    delta = (current - previous) % 2**32
+    if current >= previous:
+        return delta, None
+    if delta < 2**31:
+        return delta, 'wraparound'
+    return current, 'reset'
+
+
+def create_tables(db_cur):
+    db_cur.execute('''
+        CREATE TABLE IF NOT EXISTS sage2_gap (
+            start       DATETIME NOT NULL,
+            end         DATETIME NOT NULL,
+            boiler      INTEGER NOT NULL,
+            register    INTEGER NOT NULL,
+            title       TEXT NOT NULL,
+            counted     INTEGER NOT NULL,
+            observed    REAL NOT NULL,
+            missed      REAL NOT NULL,
+            reason      TEXT NULL
+        );
+    ''')
+    # Counted and observed activity not yet written as a gap, per counter
+    db_cur.execute('''
+        CREATE TABLE IF NOT EXISTS sage2_counter_residual (
+            boiler      INTEGER NOT NULL,
+            register    INTEGER NOT NULL,
+            start       DATETIME NOT NULL,
+            counted     INTEGER NOT NULL,
+            observed    REAL NOT NULL,
+            PRIMARY KEY (boiler, register)
+        );
+    ''')
+    # Finds the previous sample without scanning the whole table
+    db_cur.execute('''
+        CREATE INDEX IF NOT EXISTS sage2_reading_boiler_timestamp
+        ON sage2_reading (boiler, timestamp);
+    ''')
+
+
+def reconcile(db_cur, boiler, current, timestamp=None):
+    """Compare counters in current (register to raw value) with the latest
+    sample already logged for boiler, writing sage2_gap records wherever the
+    counters disagree with what the samples show
+
+    Differences too small to write (e.g. part of an hour) are carried in
+    sage2_counter_residual until they add up. A gap covers only the intervals
+    over which the difference built up: whenever the running total is no
+    further from zero than before, its start moves up to the current sample.
+    Call before logging current. Returns the list of gap records written.
+    """
+    if timestamp is None:
+        timestamp = db_cur.execute('SELECT CURRENT_TIMESTAMP').fetchone()[0]
+    start = db_cur.execute(
+        'SELECT MAX(timestamp) FROM sage2_reading WHERE boiler = ?',
+        (boiler,)).fetchone()[0]
+    if start is None:
+        return []
+    previous = dict(db_cur.execute(
+        'SELECT register, raw_value FROM sage2_reading '
+        'WHERE boiler = ? AND timestamp = ?', (boiler, start)))
+    elapsed = _parse_timestamp(timestamp) - _parse_timestamp(start)
+
+    residuals = dict(
+        (register, (residual_start, counted, observed))
+        for register, residual_start, counted, observed in db_cur.execute(
+            'SELECT register, start, counted, observed '
+            'FROM sage2_counter_residual WHERE boiler = ?', (boiler,)))
+
+    gaps = []
+    for counter in COUNTERS:
+        if counter.register not in previous or counter.register not in current:
+            continue
+        counted, reason = counter_delta(
+            previous[counter.register], current[counter.register])
+        observed = counter.observe(previous, current, elapsed)
+
+        gap_start, carried_counted, carried_observed = residuals.get(
+            counter.register, (start, 0, 0.0))
+        carried_missed = carried_counted - carried_observed
+        counted += carried_counted
+        observed += carried_observed
+        missed = counted - observed
+
+        if counter.settled(missed) or reason:
+            gaps.append({
+                'start': gap_start, 'end': timestamp, 'boiler': boiler,
+                'register': counter.register, 'title': counter.title,
+                'counted': counted, 'observed': observed, 'missed': missed,
+                'reason': reason,
+            })
+            db_cur.execute(
+                'DELETE FROM sage2_counter_residual '
+                'WHERE boiler = ? AND register = ?', (boiler, counter.register))
+        else:
+            if abs(missed) <= abs(carried_missed):
+                # Not building up, so nothing before now belongs in a gap
+                gap_start = timestamp
+            db_cur.execute(
+                'INSERT OR REPLACE INTO sage2_counter_residual '
+                'VALUES (?, ?, ?, ?, ?)',
+                (boiler, counter.register, gap_start, counted, observed))
+
+    db_cur.executemany('''
+        INSERT INTO sage2_gap VALUES (
+            :start, :end, :boiler, :register, :title,
+            :counted, :observed, :missed, :reason
+        );
+    ''', gaps)
+    return gaps
+
+
+def report(db_con, boiler=1, period='day'):
+    """Returns {period: {counter title: total}} of cycles and hours, i.e.
+    activity observed in logged samples plus missed activity from sage2_gap
+
+    Observed and missed activity are both prorated over the periods each
+    interval or gap spans.
+    """
+    key, prefix = PERIODS[period]
+    totals = defaultdict(lambda: defaultdict(float))
+
+    rows = db_con.execute('''
+        SELECT timestamp, register, raw_value FROM sage2_reading
+        WHERE boiler = ? AND register IN (%s)
+        ORDER BY timestamp
+    ''' % ','.join('?' * len(STATE_REGISTERS)), (boiler,) + STATE_REGISTERS)
+
+    def samples():
+        timestamp, sample = None, {}
+        for row_timestamp, register, raw_value in rows:
+            if row_timestamp != timestamp:
+                if sample:
+                    yield timestamp, sample
+                timestamp, sample = row_timestamp, {}
+            sample[register] = raw_value
+        if sample:
+            yield timestamp, sample
+
+    previous = None
+    for timestamp, sample in samples():
+        if previous:
+            start = previous[0]
+            elapsed = _parse_timestamp(timestamp) - _parse_timestamp(start)
+            for counter in COUNTERS:
+                observed = counter.observe(previous[1], sample, elapsed)
+                if not observed:
+                    continue
+                if start[:prefix] == timestamp[:prefix]:
+                    totals[timestamp[:prefix]][counter.title] += observed
+                    continue
+                for name, fraction in _prorate(start, timestamp, key):
+                    totals[name][counter.title] += observed * fraction
+        previous = timestamp, sample
+
+    for start, end, title, missed in db_con.execute(
+            'SELECT start, end, title, missed FROM sage2_gap WHERE boiler = ?',
+            (boiler,)):
+        for name, fraction in _prorate(start, end, key):
+            totals[name][title] += missed * fraction
+
+    return totals
+
+
+def _prorate(start, end, key):
+    "Yields (period name, fraction of start-end within period)"
+    start, end = _parse_timestamp(start), _parse_timestamp(end)
+    if end <= start:
+        yield time.strftime(key, time.gmtime(end)), 1.0
+        return
+    at = start
+    while at < end:
+        name = time.strftime(key, time.gmtime(at))
+        # Step forward a day at a time until the period name changes
+        boundary = (at // 86400 + 1) * 86400
+        while boundary < end and time.strftime(key, time.gmtime(boundary)) == name:
+            boundary += 86400
+        boundary = min(boundary, end)
+        yield name, (boundary - at) / float(end - start)
+        at = boundary
+
+
+def _parse_timestamp(timestamp):
+    "SQLite CURRENT_TIMESTAMP (UTC) to seconds since the epoch"
+    return calendar.timegm(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S'))
+
+
+if __name__ == '__main__':
+    import sqlite3
+    import sys
+    from tabulate import tabulate
+
+    db_con = sqlite3.connect(sys.argv[1])
+    period = len(sys.argv) > 2 and sys.argv[2] or 'day'
+    totals = report(db_con, period=period)
+    titles = [counter.title for counter in COUNTERS]
+    print(tabulate(
+        [[name] + [round(totals[name][title], 1) for title in titles]
+         for name in sorted(totals)],
+        headers=[period.title()] + titles))
+    db_con.close()
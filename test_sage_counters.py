@@ -0,0 +1,76 @@
+import calendar
+import sqlite3
+import time
+
+import pytest
+
+import sage_counters
+
+BURNER_STANDBY = 1 # see Sage2BurnerStateReading
+CYCLE_COUNT = 128
+
+
+def _timestamp(seconds):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+
+@pytest.fixture
+def db_con():
+    db_con = sqlite3.connect(':memory:')
+    db_con.execute('''
+        CREATE TABLE sage2_reading (
+            timestamp   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            boiler      INTEGER NOT NULL,
+            register    INTEGER NOT NULL,
+            raw_value   INTEGER NOT NULL,
+            value       INTEGER NULL,
+            title       TEXT NOT NULL,
+            description TEXT NULL
+        );
+    ''')
+    sage_counters.create_tables(db_con.cursor())
+    yield db_con
+    db_con.close()
+
+
+def _poll(db_cur, timestamp, burner_state, cycles):
+    "Reconcile then log one sample, as log_sqlite3.py does"
+    current = {sage_counters.BURNER_STATE: burner_state, CYCLE_COUNT: cycles}
+    gaps = sage_counters.reconcile(db_cur, 1, current, timestamp)
+    db_cur.executemany(
+        'INSERT INTO sage2_reading VALUES (?, 1, ?, ?, ?, ?, NULL)',
+        [(timestamp, register, raw_value, raw_value, str(register))
+         for register, raw_value in current.items()])
+    return gaps
+
+
+def test_outage_after_clean_polls(db_con):
+    """An outage after two weeks of fully observed cycles gets a gap covering
+    only the outage, so daily totals stay exact"""
+    db_cur = db_con.cursor()
+    at = calendar.timegm((2024, 1, 1, 0, 0, 0))
+    outage = calendar.timegm((2024, 1, 15, 0, 0, 0))
+    cycles, gaps = 0, []
+
+    # One observed burner cycle per hour, polled every 10 minutes
+    while at < outage:
+        running = at % 3600 == 1200
+        cycles += running
+        state = sage_counters.BURNER_RUN if running else BURNER_STANDBY
+        gaps += _poll(db_cur, _timestamp(at), state, cycles)
+        at += 600
+
+    # Two hours without polls, over which 5 cycles are missed
+    at += 2 * 3600
+    cycles += 5
+    gaps += _poll(db_cur, _timestamp(at), BURNER_STANDBY, cycles)
+
+    assert [(g['start'], g['end'], g['missed']) for g in gaps] == [
+        ('2024-01-14 23:50:00', '2024-01-15 02:00:00', 5)]
+
+    totals = sage_counters.report(db_con, period='day')
+    title = 'Cycle Count (Burner)'
+    for day in range(1, 14):
+        assert totals['2024-01-%02d' % day][title] == 24
+    assert totals['2024-01-14'][title] == pytest.approx(24 + 5 / 13.0)
+    assert totals['2024-01-15'][title] == pytest.approx(5 * 12 / 13.0)